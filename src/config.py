@@ -7,3 +7,6 @@ IMAGE_DIR = os.path.join(BASE_DIR, 'images', 'scraped')
 TXT_DIR = os.path.join(BASE_DIR, 'txt', 'scraped')
 FAILED_HTML_FILE = os.path.join(BASE_DIR, 'html', 'failed_html.txt')
 FAILED_IMAGES_FILE = os.path.join(BASE_DIR, 'images', 'failed_images.txt')
+HTTP_CACHE_FILE = os.path.join(BASE_DIR, 'http_cache.sqlite')
+
+LOG_LEVEL = 'INFO'
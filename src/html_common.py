@@ -0,0 +1,106 @@
+import mmap
+import os
+import signal
+from contextlib import contextmanager
+from lxml import etree
+import lxml.html
+
+# The scraper saves pages as UTF-8, whatever the server sent, so parse the raw bytes as such
+HTML_PARSER = lxml.html.HTMLParser(encoding='utf-8')
+
+# XPath equivalents of the CSS selectors for the main content, in order of preference.
+# Written as /descendant::...[1] so the search stops at the first match in the document
+MAIN_CONTENT_XPATHS = [
+    etree.XPath(xpath) for xpath in [
+        "/descendant::div[contains(concat(' ', normalize-space(@class), ' '), ' content ')][1]",       # div.content
+        "/descendant::div[contains(concat(' ', normalize-space(@class), ' '), ' main-content ')][1]",  # div.main-content
+        "/descendant::article[1]",                                                                      # article
+        "/descendant::*[@id='main'][1]",                                                                # #main
+        "/descendant::*[contains(concat(' ', normalize-space(@class), ' '), ' article ')][1]",         # .article
+    ]
+]
+
+class ProcessingTimeout(BaseException):
+    """
+    Raised inside a worker when a file takes longer than its time limit.
+    Derived from BaseException, so the per-file error handling of the
+    converters doesn't catch it as an ordinary processing error.
+    """
+
+def _raise_processing_timeout(signum, frame):
+    raise ProcessingTimeout()
+
+@contextmanager
+def time_limit(seconds):
+    """
+    Limits the time the enclosed block may run in the current process, using
+    SIGALRM. The limit is checked between Python instructions, so it stops a
+    runaway conversion but not a single long call into C code. Platforms
+    without SIGALRM, like Windows, run the block without a limit.
+
+    Args:
+        seconds (float): Maximum run time of the block.
+
+    Raises:
+        ProcessingTimeout: If the block runs longer than the limit.
+    """
+    if not hasattr(signal, 'SIGALRM'):
+        yield
+        return
+    previous_handler = signal.signal(signal.SIGALRM, _raise_processing_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+@contextmanager
+def map_html_file(file_path):
+    """
+    Maps an HTML file into memory read-only, so regexes and the parser can
+    read its bytes without a copy.
+
+    Args:
+        file_path (str): Path to the HTML file.
+
+    Yields:
+        mmap.mmap: The mapped file content.
+
+    Raises:
+        ValueError: If the file is empty and can't be mapped.
+    """
+    with open(file_path, 'rb') as file:
+        # mmap can't map an empty file, report it as such instead of mmap's own error
+        if os.fstat(file.fileno()).st_size == 0:
+            raise ValueError("{} is empty".format(file_path))
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as html_content:
+            yield html_content
+
+def parse_html(html_content):
+    """
+    Parses raw HTML bytes into an lxml document.
+
+    Args:
+        html_content (bytes or mmap.mmap): UTF-8 encoded HTML content.
+
+    Returns:
+        lxml.html.HtmlElement: The root element of the parsed document.
+    """
+    return lxml.html.document_fromstring(html_content, parser=HTML_PARSER)
+
+def find_main_content(root):
+    """
+    Finds the main content element, trying the selectors in order of preference.
+
+    Args:
+        root (lxml.html.HtmlElement): Parsed HTML document.
+
+    Returns:
+        HtmlElement or None: The first matching element, or None if no selector matches.
+    """
+    for xpath in MAIN_CONTENT_XPATHS:
+        matches = xpath(root)
+        if matches:
+            return matches[0]
+    return None
@@ -1,12 +1,35 @@
 import os
+import re
+import hashlib
 import html2text
-from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
 from tqdm import tqdm
 import concurrent.futures
+from collections import OrderedDict
 import config as cfg
+import html_common
 
-# Directories to save txt pages
-os.makedirs(cfg.TXT_DIR, exist_ok=True)
+# Selects the og:title content of the document head
+OG_TITLE_XPATH = etree.XPath('/html/head/meta[@property="og:title"]/@content')
+
+# Patterns used to condense the markdown output
+TRAILING_WHITESPACE_RE = re.compile(r'[^\S\n]+$', re.MULTILINE)
+MULTI_BLANK_RE = re.compile(r'\n{3,}')
+
+# Seconds a worker may spend on a single file before skipping it
+PROCESSING_TIMEOUT = 30
+
+# Converter used by each worker process, set up by _get_converter
+_converter = None
+
+# Number of recent conversions each worker keeps; shared content repeats
+# between nearby pages, so a small cache catches it without growing with the run
+MARKDOWN_CACHE_SIZE = 256
+
+# Markdown recently converted in this process, keyed by a hash of the HTML,
+# least recently used first
+_markdown_cache = OrderedDict()
 
 def setup_html2text_converter():
     """
@@ -32,26 +55,26 @@ def setup_html2text_converter():
     
     return h
 
-def extract_metadata(soup, filename):
+def extract_metadata(root, filename):
     """
-    Extract metadata from HTML soup.
+    Extract metadata from the parsed HTML.
     
     Args:
-        soup (BeautifulSoup): Parsed HTML content.
+        root (lxml.html.HtmlElement): Parsed HTML document.
         filename (str): The HTML filename.
         
     Returns:
         dict: Metadata dictionary with title, url, and filename.
     """
     # Try to get og:title first
-    og_title = soup.find('meta', property='og:title')
-    if og_title and og_title.get('content'):
-        title = og_title['content'].strip()
+    og_title = OG_TITLE_XPATH(root)
+    if og_title and og_title[0]:
+        title = og_title[0].strip()
     else:
         # Fallback to regular title tag
-        title_tag = soup.find('title')
-        if title_tag and title_tag.string:
-            title = title_tag.string.strip()
+        title_text = root.findtext('.//title')
+        if title_text:
+            title = title_text.strip()
         else:
             # Final fallback: create title from filename
             base_name = os.path.splitext(filename)[0]
@@ -92,68 +115,62 @@ filename: {metadata['filename']}
     
     return frontmatter
 
-def extract_main_content(filename, html_content):
+def extract_main_content(filename, root):
     """
-    Extracts the main content from HTML using CSS selectors.
+    Extracts the main content from HTML using precompiled XPath selectors.
 
     Args:
         filename (str): The name of the file being processed.
-        html_content (str): The HTML content to be parsed.
+        root (lxml.html.HtmlElement): Parsed HTML document.
 
     Returns:
-        str: HTML content of the main section, or empty string if not found.
+        HtmlElement or None: The main section element, or None if not found.
     """
-    soup = BeautifulSoup(html_content, 'html.parser')
-    
-    main_content_selectors = [
-        'div.content',
-        'div.main-content', 
-        'article',
-        '#main',
-        '.article',
-    ]
-
-    # Try each selector until we find content
-    for selector in main_content_selectors:
-        main_content = soup.select_one(selector)
-        if main_content:
-            return str(main_content)
+    main_content = html_common.find_main_content(root)
+    if main_content is not None:
+        return main_content
     
     # If no main content found, try to extract body content
-    body = soup.find('body')
-    if body:
+    body = root.find('body')
+    if body is not None:
         print(f"No main content selectors matched for {filename}, using body content")
-        return str(body)
+        return body
     
     print(f"No relevant content found for {filename}")
-    return ""
+    return None
+
+def _is_site_relative(url):
+    """
+    Checks whether a URL is relative to the site root, like /subsidies/,
+    and not protocol-relative, like //cdn.example.com/.
+
+    Args:
+        url (str): The URL to check.
+
+    Returns:
+        bool: True if the URL starts with a single slash.
+    """
+    return url[:1] == '/' and url[1:2] != '/'
 
-def process_links(html_content, base_url="https://www.amsterdam.nl"):
+def process_links(content, base_url="https://www.amsterdam.nl"):
     """
-    Processes relative links to make them absolute.
+    Processes relative links in place to make them absolute.
     
     Args:
-        html_content (str): HTML content to process.
+        content (HtmlElement): Parsed HTML element to process.
         base_url (str): Base URL to prepend to relative links.
         
     Returns:
-        str: HTML content with absolute links.
+        HtmlElement: The same element, with absolute links.
     """
-    soup = BeautifulSoup(html_content, 'html.parser')
+    # Fix relative links and image sources in a single walk over the element
+    for element in content.iter('a', 'img'):
+        attribute = 'href' if element.tag == 'a' else 'src'
+        value = element.get(attribute)
+        if value is not None and _is_site_relative(value):
+            element.set(attribute, base_url + value)
     
-    # Fix relative links
-    for link in soup.find_all('a', href=True):
-        href = link['href']
-        if href.startswith('/') and not href.startswith('//'):
-            link['href'] = base_url + href
-    
-    # Fix relative image sources
-    for img in soup.find_all('img', src=True):
-        src = img['src']
-        if src.startswith('/') and not src.startswith('//'):
-            img['src'] = base_url + src
-    
-    return str(soup)
+    return content
 
 def simple_condense(markdown_content):
     """
@@ -165,19 +182,40 @@ def simple_condense(markdown_content):
     Returns:
         str: Simply condensed markdown content.
     """
-    import re
+    # Remove trailing whitespace from each line
+    condensed = TRAILING_WHITESPACE_RE.sub('', markdown_content)
     
     # Remove multiple consecutive empty lines, replace with single empty line
-    condensed = re.sub(r'\n\s*\n\s*\n+', '\n\n', markdown_content)
-    
-    # Remove trailing whitespace from each line
-    condensed = '\n'.join(line.rstrip() for line in condensed.split('\n'))
+    condensed = MULTI_BLANK_RE.sub('\n\n', condensed)
     
     # Remove leading/trailing empty lines
     condensed = condensed.strip()
     
     return condensed
 
+def convert_to_markdown(html_bytes, converter):
+    """
+    Converts HTML to markdown, reusing the result when the exact same HTML
+    was converted before. Many pages share identical main content.
+
+    Args:
+        html_bytes (bytes): UTF-8 encoded HTML content to convert.
+        converter (html2text.HTML2Text): Configured converter instance.
+
+    Returns:
+        str: Raw markdown content from html2text.
+    """
+    key = hashlib.blake2b(html_bytes, digest_size=16).digest()
+    markdown_content = _markdown_cache.get(key)
+    if markdown_content is None:
+        markdown_content = converter.handle(html_bytes.decode('utf-8'))
+        _markdown_cache[key] = markdown_content
+        if len(_markdown_cache) > MARKDOWN_CACHE_SIZE:
+            _markdown_cache.popitem(last=False)
+    else:
+        _markdown_cache.move_to_end(key)
+    return markdown_content
+
 def process_html_file(file_path, filename, converter):
     """
     Processes an HTML file: extracts metadata, creates YAML frontmatter, 
@@ -192,23 +230,27 @@ def process_html_file(file_path, filename, converter):
         str: YAML frontmatter + condensed markdown content.
     """
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            html_content = file.read()
+        # Empty files can't be mapped or parsed and simply have no content
+        try:
+            with html_common.map_html_file(file_path) as html_content:
+                root = html_common.parse_html(html_content)
+        except (ValueError, etree.ParserError):
+            print(f"No relevant content found for {filename}")
+            return ""
         
-        # Parse HTML to extract metadata
-        soup = BeautifulSoup(html_content, 'html.parser')
-        metadata = extract_metadata(soup, filename)
+        metadata = extract_metadata(root, filename)
         
-        # Extract main content HTML
-        main_html = extract_main_content(filename, html_content)
-        if not main_html:
+        # Extract main content element
+        main_content = extract_main_content(filename, root)
+        if main_content is None:
             return ""
         
         # Process links to make them absolute
-        processed_html = process_links(main_html)
+        process_links(main_content)
         
         # Convert to markdown using html2text
-        markdown_content = converter.handle(processed_html)
+        main_html = lxml.html.tostring(main_content, encoding='utf-8', with_tail=False)
+        markdown_content = convert_to_markdown(main_html, converter)
         
         # Simple condensing (remove excessive empty lines)
         condensed_markdown = simple_condense(markdown_content)
@@ -225,41 +267,83 @@ def process_html_file(file_path, filename, converter):
         print(f"Error processing {filename}: {e}")
         return ""
 
+def _get_converter():
+    """
+    Returns the html2text converter of the current process, setting it up on
+    first use. Each worker keeps one instance for all files it processes.
+
+    Returns:
+        html2text.HTML2Text: Configured converter instance.
+    """
+    global _converter
+    if _converter is None:
+        _converter = setup_html2text_converter()
+    return _converter
+
+def _init_worker():
+    """
+    Sets up the html2text converter once per worker process, so it does not
+    have to be pickled and sent along with every file.
+    """
+    _get_converter()
+
+def _worker(file_path):
+    """
+    Processes a single HTML file inside a worker process, within the
+    processing time limit.
+
+    Args:
+        file_path (str): Path to the HTML file.
+
+    Returns:
+        str or None: YAML frontmatter + condensed markdown content, or None
+            if the file took too long.
+    """
+    try:
+        with html_common.time_limit(PROCESSING_TIMEOUT):
+            return process_html_file(file_path, os.path.basename(file_path), _get_converter())
+    except html_common.ProcessingTimeout:
+        return None
+
 def load_html_content(directory, output_directory):
     """
     Loads HTML content from all files and converts to YAML frontmatter + markdown format.
+    Files are processed in parallel using a pool of worker processes, and a
+    file that takes longer than PROCESSING_TIMEOUT seconds is skipped.
 
     Args:
         directory (str): Path to the directory containing HTML files.
         output_directory (str): Path to the directory where output text files will be saved.
     """
-    # Set up the converter once
-    converter = setup_html2text_converter()
+    # Directory to save txt pages
+    os.makedirs(output_directory, exist_ok=True)
     
-    html_files = [f for f in os.listdir(directory) if f.endswith('.html')]
+    with os.scandir(directory) as entries:
+        html_files = [entry for entry in entries if entry.name.endswith('.html')]
     
-    for filename in tqdm(html_files, desc="Processing HTML files"):
-        file_path = os.path.join(directory, filename)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                                initializer=_init_worker) as executor:
+        futures = [executor.submit(_worker, entry.path) for entry in html_files]
         
-        try:
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(process_html_file, file_path, filename, converter)
-                processed_content = future.result(timeout=30)
-            
-            if processed_content:
-                # Generate output filename
-                base_name = os.path.splitext(filename)[0]
-                output_file_path = os.path.join(output_directory, f"{base_name}.txt")
-                
-                with open(output_file_path, 'w', encoding='utf-8') as output_file:
-                    output_file.write(processed_content)
-            else:
-                print(f"No content extracted from {filename}")
+        for entry, future in tqdm(zip(html_files, futures), total=len(html_files),
+                                  desc="Processing HTML files"):
+            filename = entry.name
+            try:
+                processed_content = future.result()
                 
-        except concurrent.futures.TimeoutError:
-            print(f"Processing {filename} took too long and was skipped.")
-        except Exception as e:
-            print(f"Error processing {filename}: {e}")
+                if processed_content is None:
+                    print(f"Processing {filename} took too long and was skipped.")
+                elif processed_content:
+                    # Generate output filename
+                    output_file_path = os.path.join(output_directory, f"{filename[:-5]}.txt")
+                    
+                    with open(output_file_path, 'w', encoding='utf-8') as output_file:
+                        output_file.write(processed_content)
+                else:
+                    print(f"No content extracted from {filename}")
+                    
+            except Exception as e:
+                print(f"Error processing {filename}: {e}")
 
 # Load and process HTML content
 if __name__ == "__main__":
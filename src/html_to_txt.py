@@ -1,67 +1,75 @@
 import os
 import re
-from bs4 import BeautifulSoup
+from lxml import etree
 from tqdm import tqdm
 import concurrent.futures
 import config as cfg
+import html_common
 
-# Directories to save txt pages
-os.makedirs(cfg.TXT_DIR, exist_ok=True)
+# Seconds a worker may spend on a single file before skipping it
+PROCESSING_TIMEOUT = 10
 
-def extract_main_content_with_hrefs_and_api_dynamic(filename, html_content):
+# Elements whose text is collected from the main content, in document order
+TEXT_ELEMENT_TAGS = ('p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'a', 'ol', 'ul')
+
+# All text below an element, leaving out scripts, styles and templates
+TEXT_NODES_XPATH = etree.XPath(
+    './/text()[not(ancestor::script or ancestor::style or ancestor::template)]',
+    smart_strings=False,
+)
+
+# Patterns used to space out the link and image markers in the output. They run
+# over all lines joined by NUL characters, which a marker never spans
+LINK_RE = re.compile(r'(\[LINK:[^\]\0]+\]\([^\)\0]+\))')
+IMG_RE = re.compile(r'(\[IMG:[^\]\0]+\])')
+WHITESPACE_RE = re.compile(r'\s+')
+LINE_SEPARATOR_RE = re.compile(r' ?\0 ?')
+
+def extract_main_content_with_hrefs_and_api_dynamic(filename, root):
     """
     Extracts the main content from HTML, including handling images and API data,
     and processes text elements to replace hrefs dynamically.
 
     Args:
         filename (str): The name of the file being processed.
-        html_content (str): The HTML content to be parsed.
+        root (lxml.html.HtmlElement): Parsed HTML document.
 
     Returns:
         list: Processed text elements from the main content.
     """
-    soup = BeautifulSoup(html_content, 'html.parser')
-    main_content_selectors = [
-        'div.content',
-        'div.main-content',
-        'article',
-        '#main',
-        '.article',
-    ]
-
-    main_content_container = get_main_content_container(soup, main_content_selectors)
-
-    if main_content_container:
+    main_content_container = html_common.find_main_content(root)
+
+    if main_content_container is not None:
         text_list, href_dict = parse_main_content(main_content_container)
         return text_list, href_dict
     else:
         print("Relevant content not found for {}".format(filename))
         return [], {}
 
-def get_main_content_container(soup, selectors):
+def get_text(element):
     """
-    Finds the main content container in the parsed HTML soup using provided selectors.
+    Gets the text of an element with each piece of text stripped, like
+    BeautifulSoup's get_text(strip=True).
 
     Args:
-        soup (BeautifulSoup): The parsed HTML content.
-        selectors (list): List of CSS selectors to identify the main content.
+        element (HtmlElement): The element to get the text from.
 
     Returns:
-        Tag or None: The first matching element found or None if no match is found.
+        str: The stripped text pieces joined together.
     """
-    return next((soup.select_one(selector) for selector in selectors if soup.select_one(selector)), None)
+    return ''.join(text.strip() for text in TEXT_NODES_XPATH(element))
 
 def handle_image_element(element):
     """
     Creates an HTML string for an image element.
 
     Args:
-        element (Tag): The image tag.
+        element (HtmlElement): The image tag.
 
     Returns:
         str: HTML string representation of the image tag.
     """
-    src = element["src"]
+    src = element.attrib["src"]
     if "https" not in src:
         src = "https://www.amsterdam.nl" + src
     return "[IMG: {}]".format(src)
@@ -77,13 +85,14 @@ def input_hrefs(text_list, replacement_dict):
     Returns:
         list: Updated list with hrefs replaced.
     """
-    updated_list = []
-    for text in text_list:
-        for key, href in replacement_dict.items():
-            if key in text:
-                text = text.replace(key, href)
-        updated_list.append(text)
-    return updated_list
+    if not replacement_dict:
+        return text_list
+    
+    # Match all keys in one pass, longest first so a short key can't take
+    # over part of a longer one
+    keys = sorted(replacement_dict, key=len, reverse=True)
+    pattern = re.compile('|'.join(re.escape(key) for key in keys))
+    return [pattern.sub(lambda match: replacement_dict[match.group()], text) for text in text_list]
 
 def clean_list(input_list):
     """
@@ -101,34 +110,31 @@ def clean_list(input_list):
 
 def add_space_around_patterns(text_list):
     """
-    Add spaces around specific patterns in a list of strings.
+    Add spaces around specific patterns in a list of strings and join them into lines.
     
     This function processes a list of strings and adds spaces around 
     '[LINK: ...](...)' and '[IMG: ...]' patterns if they are concatenated 
     with other elements. It also removes extra spaces if already present.
+    The patterns run once over the whole text instead of once per string.
 
     Args:
         text_list (list of str): List of strings to be processed.
 
     Returns:
-        list of str: List of processed strings with spaces added around specified patterns.
+        str: The processed strings, one per line, with spaces added around specified patterns.
     """
-    link_pattern = re.compile(r'(\[LINK:[^\]]+\]\([^\)]+\))')
-    img_pattern = re.compile(r'(\[IMG:[^\]]+\])')
-    modified_text_list = []
-    for text in text_list:
-        modified_text = re.sub(link_pattern, r' \1 ', text)
-        modified_text = re.sub(img_pattern, r' \1 ', modified_text)
-        modified_text = re.sub(r'\s+', ' ', modified_text)
-        modified_text_list.append(modified_text.strip())
-    return modified_text_list
+    text = '\0'.join(text_list)
+    text = LINK_RE.sub(r' \1 ', text)
+    text = IMG_RE.sub(r' \1 ', text)
+    text = WHITESPACE_RE.sub(' ', text)
+    return LINE_SEPARATOR_RE.sub('\n', text).strip(' ')
 
 def parse_main_content(container):
     """
     Parses the main content container to extract text and handle various elements.
 
     Args:
-        container (Tag): The main content container element.
+        container (HtmlElement): The main content container element.
 
     Returns:
         tuple: A tuple containing the text list and href dictionary.
@@ -136,35 +142,47 @@ def parse_main_content(container):
     text_list = []
     href_dict = {}
     prev_element = ""
+    
+    # All items of text_list joined together, so an element's text can be
+    # looked up with one substring search instead of a scan of every item
+    joined_text = ""
+    joined_count = 0
 
-    for element in container.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'a', 'ol', 'ul']):
+    for element in container.iterdescendants(*TEXT_ELEMENT_TAGS):
         to_add = None
-        cur_element = element.name
+        cur_element = element.tag
 
-        if element.name == 'a' and element.get('href'):
-            text = element.get_text(strip=True)
-            addition = "[LINK: {}]({})".format(text, element["href"])
+        if element.tag == 'a' and element.get('href'):
+            text = get_text(element)
+            addition = "[LINK: {}]({})".format(text, element.get('href'))
             if text:
                 href_dict[text] = addition
             else:
                 to_add = addition
 
-        elif element.name == 'div' and element.has_attr('data-keys') and element.has_attr('data-config'):
+        elif element.tag == 'div' and 'data-keys' in element.attrib and 'data-config' in element.attrib:
             data_keys = element.get('data-keys')
             data_config = element.get('data-config')
             to_add = f'\nAPI Information:\ndata-keys: {data_keys}\ndata-config: {data_config}\n'
 
-        elif element.name == 'p' and element.find('img'):
-            text = element.get_text(strip=True)
+        elif element.tag == 'p' and element.find('.//img') is not None:
+            text = get_text(element)
             if text:
                 text_list.append(text)
-            img_element = element.find('img')
+            img_element = element.find('.//img')
             to_add = handle_image_element(img_element)
 
         else:
-            to_add = element.get_text(strip=True)
+            to_add = get_text(element)
             if to_add:
-                text_list = [item.replace(to_add, "HEX") if to_add in item else item for item in text_list]
+                if joined_count < len(text_list):
+                    joined_text += "\0" + "\0".join(text_list[joined_count:])
+                    joined_count = len(text_list)
+                if to_add in joined_text:
+                    for i, item in enumerate(text_list):
+                        if to_add in item:
+                            text_list[i] = item.replace(to_add, "HEX")
+                    joined_text = "\0".join(text_list)
 
         if to_add:
             if any(
@@ -186,16 +204,22 @@ def process_html_file(file_path, filename):
         filename (str): Name of the HTML file.
 
     Returns:
-        list: Processed text elements from the main content.
+        str: Processed text of the main content, one element per line.
     """
-    with open(file_path, 'r', encoding='utf-8') as file:
-        html_content = file.read()
-    processed_text, href_dict = extract_main_content_with_hrefs_and_api_dynamic(filename, html_content)
-    if processed_text:
-        processed_text = clean_list(processed_text)
-        processed_text = input_hrefs(processed_text, href_dict)
-        processed_text = add_space_around_patterns(processed_text)
-    return processed_text
+    # Empty files can't be mapped or parsed and simply have no content
+    try:
+        with html_common.map_html_file(file_path) as html_content:
+            # Parse HTML once and work on the same tree from here on
+            root = html_common.parse_html(html_content)
+    except (ValueError, etree.ParserError):
+        print("Relevant content not found for {}".format(filename))
+        return ""
+    processed_text, href_dict = extract_main_content_with_hrefs_and_api_dynamic(filename, root)
+    if not processed_text:
+        return ""
+    processed_text = clean_list(processed_text)
+    processed_text = input_hrefs(processed_text, href_dict)
+    return add_space_around_patterns(processed_text)
 
 def transform_string(input_string):
     """
@@ -225,9 +249,29 @@ def transform_string(input_string):
 
     return markdown_link
 
+def _worker(file_path):
+    """
+    Processes a single HTML file inside a worker process, within the
+    processing time limit.
+
+    Args:
+        file_path (str): Path to the HTML file.
+
+    Returns:
+        str or None: Processed text of the main content, or None if the file
+            took too long.
+    """
+    try:
+        with html_common.time_limit(PROCESSING_TIMEOUT):
+            return process_html_file(file_path, os.path.basename(file_path))
+    except html_common.ProcessingTimeout:
+        return None
+
 def load_html_content(directory, output_directory):
     """
     Loads HTML content from all files in the specified directory and saves processed text to output directory.
+    Files are processed in parallel using a pool of worker processes, and a
+    file that takes longer than PROCESSING_TIMEOUT seconds is skipped.
 
     Args:
         directory (str): Path to the directory containing HTML files.
@@ -236,21 +280,34 @@ def load_html_content(directory, output_directory):
     Returns:
         None
     """
-    for filename in tqdm(os.listdir(directory), desc="Processing HTML files"):
-        if filename.endswith('.html'):
-            file_path = os.path.join(directory, filename)
+    # Directory to save txt pages
+    os.makedirs(output_directory, exist_ok=True)
+    
+    with os.scandir(directory) as entries:
+        html_files = [entry for entry in entries if entry.name.endswith('.html')]
+    
+    with concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = [executor.submit(_worker, entry.path) for entry in html_files]
+        
+        for entry, future in tqdm(zip(html_files, futures), total=len(html_files),
+                                  desc="Processing HTML files"):
+            filename = entry.name
+            base_name = filename[:-5]
             try:
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(process_html_file, file_path, filename)
-                    processed_text = future.result(timeout=10)
+                processed_text = future.result()
+                if processed_text is None:
+                    print(f"Processing {filename} took too long and was skipped.")
+                    continue
                 
-                output_file_path = os.path.join(output_directory, f"{os.path.splitext(filename)[0]}.txt")
-                with open(output_file_path, 'w', encoding='utf-8') as output_file:
-                    output_file.write('{}\n\n'.format(transform_string(os.path.splitext(filename)[0])))
-                    output_file.write('\n'.join(processed_text))
+                output_file_path = os.path.join(output_directory, f"{base_name}.txt")
+                page_link = transform_string(base_name)
+                payload = '{}\n\n{}'.format(page_link, processed_text).encode('utf-8')
+                with open(output_file_path, 'wb') as output_file:
+                    output_file.write(payload)
                 
-            except concurrent.futures.TimeoutError:
-                print(f"Processing {filename} took too long and was skipped.")
+            except Exception as e:
+                print(f"Error processing {filename}: {e}")
 
 # Load and process HTML content
-load_html_content(cfg.HTML_DIR, cfg.TXT_DIR)
\ No newline at end of file
+if __name__ == "__main__":
+    load_html_content(cfg.HTML_DIR, cfg.TXT_DIR)
@@ -1,31 +1,169 @@
 import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
+import codecs
 import os
+import re
 import json
-import pandas as pd
-from urllib.parse import urljoin, urlparse
-from collections import Counter, defaultdict
+import logging
+import logging.handlers
+import queue
+import sys
+import xlsxwriter
+from urllib.parse import urldefrag, urljoin, urlparse
+from collections import defaultdict
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 import config as cfg
 import ssl
 import argparse
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from lxml import etree
 
-# Directories to save images and HTML pages
-os.makedirs(cfg.IMAGE_DIR, exist_ok=True)
-os.makedirs(cfg.HTML_DIR, exist_ok=True)
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-# Sets to track saved images and HTML pages
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+try:
+    from aiohttp_client_cache import CachedSession, SQLiteBackend
+except ImportError:
+    CachedSession = None
+
+logger = logging.getLogger(__name__)
+
+# Set to track saved images
 saved_images_set = set()
-saved_html_set = set()
 
-# Lists to track failed URLs
-failed_pages = []
+# Set to track image URLs already queued for download
+queued_images_set = set()
+
+# File names in the image directory, filled at startup, so images from an
+# earlier run are not downloaded again
+existing_images_set = set()
+
+# JSON Lines file the data of each page is written to, opened by main
+overview_file = None
+
+# Failed page URLs, as a set so a page that fails on every attempt is only kept once
+failed_pages = set()
+# List to track failed image URLs
 failed_images = []
 
+# Failed pages that may succeed on a retry: those that hit a network error, a
+# timeout or a 429/5xx response. Other failures, like a 404, an error page or
+# minimal content, come out the same every time and are not fetched again
+retryable_pages = set()
+
+# Content types that are parsed and saved as HTML pages
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+# Header row of the reference URL overview in Excel
+EXCEL_COLUMNS = ('Page URL', 'Domain', 'Reference URL', 'Domain Count', 'URL Count')
+
+# Bound the number of requests in flight, so a large sitemap doesn't open
+# thousands of connections at once
+MAX_CONCURRENT_REQUESTS = 64
+request_semaphore = asyncio.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+
+# Worker tasks for fetching pages and images, and the number of items that
+# may wait in the image and HTML write queues
+NUM_PAGE_WORKERS = 64
+NUM_IMAGE_WORKERS = 32
+QUEUE_SIZE = 1024
+
+# How long a response stays in the on-disk HTTP cache, in seconds
+HTTP_CACHE_EXPIRE_AFTER = 24 * 60 * 60
+
+# Threads for the file reads and writes run through asyncio.to_thread
+NUM_DISK_THREADS = 4
+
+# Backoff before retrying failed pages: the delay doubles with every retry
+# attempt, plus random jitter, up to a maximum. A Retry-After header from the
+# server is honored up to MAX_RETRY_AFTER seconds.
+RETRY_BASE_DELAY = 1
+RETRY_MAX_DELAY = 30
+MAX_RETRY_AFTER = 300
+# Number of times a failed page is retried before it counts as failed
+MAX_PAGE_RETRIES = 10
+
+# Delay in seconds requested by the server (Retry-After) per failed URL
+retry_after = {}
+
+# Saved pages waiting to be written to disk by html_writer
+html_write_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+# Request headers and timeout for image downloads, sent on the shared session
+IMAGE_HEADERS = {
+    'User-Agent': 'SubsidiemaatjeBot',
+    'Accept': 'image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9,nl;q=0.8',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'DNT': '1',
+    'Connection': 'keep-alive',
+    'Sec-Fetch-Dest': 'image',
+    'Sec-Fetch-Mode': 'no-cors',
+    'Sec-Fetch-Site': 'same-origin',
+}
+IMAGE_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10)
+
+# Prefix of the site's own URLs, whose HTML file names are derived without
+# urlparse, and the characters that send a URL to the urlparse path instead
+SITE_URL_PREFIX = 'https://www.amsterdam.nl'
+URL_SLOW_PATH_RE = re.compile(r'[;\t\r\n]')
+
+# The netloc of an http(s) URL: everything after '//' up to the first '/', '?' or '#'
+HTTP_NETLOC_RE = re.compile(r'https?://([^/?#\[\]\t\r\n]*)(?:[/?#]|\Z)')
+
+# Absolute http(s) link targets and image sources of a page, as plain strings.
+# The scheme check runs inside the XPath engine, only counted links come back
+LINK_HREF_XPATH = etree.XPath("//a/@href[starts-with(., 'http://') or starts-with(., 'https://')]",
+                              smart_strings=False)
+IMAGE_SRC_XPATH = etree.XPath('//img/@src', smart_strings=False)
+
+# Titles and body messages that mark an error page, each searched in one pass
+ERROR_TITLES = [
+    "Internal Server Error",
+    "Error",
+    "Page Not Found",
+    "404 Not Found",
+    "Access Denied",
+    "Service Unavailable"
+]
+ERROR_MESSAGES = [
+    "An error occurred on the server",
+    "We apologize for the problem",
+    "The page you are looking for doesn't exist",
+    "This page cannot be found",
+    "You don't have permission to access",
+    "Service is temporarily unavailable"
+]
+ERROR_TITLE_RE = re.compile('|'.join(map(re.escape, ERROR_TITLES)))
+ERROR_MESSAGE_RE = re.compile('|'.join(map(re.escape, ERROR_MESSAGES)))
+# The longest word of each message, searched in the raw page bytes first. A
+# page without any of them can't contain a message, so its text isn't collected
+ERROR_MESSAGE_HINT_RE = re.compile(b'|'.join(
+    re.escape(max(re.findall(r'[A-Za-z]+', message), key=len).encode()) for message in ERROR_MESSAGES
+))
+
+# All text of a page, leaving out scripts, styles and templates
+PAGE_TEXT_XPATH = etree.XPath(
+    '//text()[not(ancestor::script or ancestor::style or ancestor::template)]',
+    smart_strings=False,
+)
+
+@lru_cache(maxsize=65536)
 def get_url_alternative(url):
     """
     Get the alternative version of a URL (add/remove trailing slash).
+    Cached, since a URL that fails is looked up again on every retry.
     
     Args:
         url (str): The original URL.
@@ -47,10 +185,61 @@ def get_url_alternative(url):
     else:
         return url + '/'
 
+def parse_retry_after(value):
+    """
+    Parse the value of a Retry-After header.
+
+    Args:
+        value (str or None): The header value, either a number of seconds or an HTTP date.
+
+    Returns:
+        float or None: The number of seconds to wait, or None if the value is invalid.
+    """
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+def is_transient_error(e):
+    """
+    Check whether a failed request is worth retrying.
+
+    Args:
+        e (Exception): The exception raised while fetching a page.
+
+    Returns:
+        bool: True for network errors, timeouts and 429/5xx responses.
+    """
+    if isinstance(e, aiohttp.ClientResponseError):
+        return e.status == 429 or e.status >= 500
+    return isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError))
+
+def get_retry_delay(url, attempt):
+    """
+    Get the time to wait before retrying a failed URL: exponential backoff
+    with random jitter, or longer if the server asked for it.
+
+    Args:
+        url (str): The URL to retry.
+        attempt (int): The retry attempt, starting at 0.
+
+    Returns:
+        float: The number of seconds to wait.
+    """
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt + random.random())
+    return max(delay, min(MAX_RETRY_AFTER, retry_after.pop(url, 0)))
+
+@lru_cache(maxsize=65536)
 def get_html_file_name(url):
     """
     Generate the expected HTML file name from a URL.
     Always normalizes to version without trailing slash for consistent file naming.
+    Cached, since the same URL is looked up when sorting, saving and reading pages.
 
     Args:
         url (str): The URL to generate the file name for.
@@ -58,6 +247,21 @@ def get_html_file_name(url):
     Returns:
         str or None: The expected HTML file name, or None if not applicable.
     """
+    # Fast path for the site's own URLs: slice the path off the known prefix
+    # instead of parsing. Anything urlparse would treat differently (another
+    # host or port, path parameters, characters it strips) takes the slow path
+    rest = url[len(SITE_URL_PREFIX):]
+    if url.startswith(SITE_URL_PREFIX) and rest[:1] in ('', '/', '?', '#') \
+            and not URL_SLOW_PATH_RE.search(rest):
+        path = rest.partition('#')[0].partition('?')[0]
+        # Drop the trailing slash, but only when it ends the URL and the path isn't the root
+        if len(path) == len(rest) and path != '/' and path.endswith('/') and not path.endswith('//'):
+            path = path[:-1]
+        html_name = path.replace('/', '_') + '.html'
+        if html_name.startswith('_'):
+            html_name = html_name[1:]
+        return html_name
+
     # Always normalize to version without trailing slash for consistent file naming
     if url.endswith('/') and not url.endswith('//'):
         parsed = urlparse(url)
@@ -73,6 +277,95 @@ def get_html_file_name(url):
     else:
         return None
 
+def write_file(path, content, mode):
+    """
+    Write content to a file. This blocks, so call it through asyncio.to_thread
+    to keep disk writes from stalling the requests in flight.
+
+    Args:
+        path (str): The file path to write to.
+        content (str or bytes): The content to write.
+        mode (str): The file mode, e.g. 'w' for text or 'xb' for new binary files.
+
+    Returns:
+        None
+    """
+    encoding = None if 'b' in mode else 'utf-8'
+    with open(path, mode, encoding=encoding) as f:
+        f.write(content)
+
+def read_file(path):
+    """
+    Read the raw bytes of a file. This blocks, so call it through
+    asyncio.to_thread to keep disk reads from stalling the requests in flight.
+
+    Args:
+        path (str): The file path to read from.
+
+    Returns:
+        bytes: The file content.
+    """
+    with open(path, 'rb') as f:
+        return f.read()
+
+def write_html_files(batch):
+    """
+    Write a batch of HTML pages to their files.
+
+    Args:
+        batch (list): A list of (url, path, content) tuples.
+
+    Returns:
+        list: The URLs of the pages that could not be written.
+    """
+    failed = []
+    for url, html_path, content in batch:
+        try:
+            write_file(html_path, content, 'wb')
+        except Exception as e:
+            logger.error("Failed to save HTML for %s: %s", url, e)
+            failed.append(url)
+    return failed
+
+async def html_writer():
+    """
+    Write the pages queued by save_html to disk until a None sentinel is
+    received. Pages that queued up while the previous batch was being written
+    are written together, in a single worker thread call.
+
+    Returns:
+        None
+    """
+    done = False
+    while not done:
+        batch = [await html_write_queue.get()]
+        while not html_write_queue.empty():
+            batch.append(html_write_queue.get_nowait())
+        if None in batch:
+            batch.remove(None)
+            done = True
+        for url in await asyncio.to_thread(write_html_files, batch):
+            failed_pages.add(url)
+
+@lru_cache(maxsize=65536)
+def get_netloc(url):
+    """
+    Get the network location (domain) of a URL. Cached, since the same
+    reference URLs recur across many pages.
+
+    Args:
+        url (str): The URL.
+
+    Returns:
+        str: The network location of the URL.
+    """
+    # Reference URLs are absolute http(s) URLs, so the netloc can be sliced out
+    # directly. Non-ASCII hosts and brackets, which urlparse validates, take the slow path
+    match = HTTP_NETLOC_RE.match(url)
+    if match and match.group(1).isascii():
+        return match.group(1)
+    return urlparse(url).netloc
+
 async def save_image(session, url):
     """
     Download and save an image from the given URL.
@@ -86,145 +379,166 @@ async def save_image(session, url):
     """
     if url in saved_images_set:
         return os.path.basename(url)
-    try:
-        async with session.get(url) as response:
-            response.raise_for_status()
-            content = await response.read()
-            image_name = os.path.basename(urlparse(url).path)
-            image_path = os.path.join(cfg.IMAGE_DIR, image_name)
-
-            if not os.path.exists(image_path):
-                with open(image_path, 'wb') as f:
-                    f.write(content)
-            saved_images_set.add(url)
-            return image_name
-    except Exception as e:
-        print(f"Failed to download image {url}: {e}")
-        failed_images.append(url)
-        return None
+    image_name = os.path.basename(urlparse(url).path)
+    if image_name in existing_images_set:
+        saved_images_set.add(url)
+        return image_name
+    async with request_semaphore:
+        try:
+            async with session.get(url, headers=IMAGE_HEADERS, timeout=IMAGE_TIMEOUT) as response:
+                response.raise_for_status()
+                content = await response.read()
+                image_path = os.path.join(cfg.IMAGE_DIR, image_name)
+
+                # Exclusive create, so an existing image is kept without a separate exists check
+                try:
+                    await asyncio.to_thread(write_file, image_path, content, 'xb')
+                except FileExistsError:
+                    pass
+                existing_images_set.add(image_name)
+                saved_images_set.add(url)
+                return image_name
+        except Exception as e:
+            logger.warning("Failed to download image %s: %s", url, e)
+            failed_images.append(url)
+            return None
 
-def is_error_page(soup, url, content_length):
+def is_error_page(root, url, content):
     """
     Check if the parsed HTML content represents an error page.
     Now includes more detailed logging for debugging.
 
     Args:
-        soup (BeautifulSoup): The parsed HTML content.
+        root (lxml.etree._Element): The root element of the parsed page.
         url (str): The URL being checked (for logging).
-        content_length (int): Length of the content.
+        content (bytes): The raw HTML content the page was parsed from.
 
     Returns:
         bool: True if it's an error page, False otherwise.
     """
     # Check for common error indicators
-    title = soup.title.string if soup.title else ''
-    error_titles = [
-        "Internal Server Error",
-        "Error",
-        "Page Not Found", 
-        "404 Not Found",
-        "Access Denied",
-        "Service Unavailable"
-    ]
-    
-    title_has_error = any(error_title in title for error_title in error_titles)
-    if title_has_error:
-        print(f"DEBUG: Error detected in title for {url}: '{title}'")
+    title_element = root.find('.//title')
+    title = (title_element.text or '') if title_element is not None else ''
+    if ERROR_TITLE_RE.search(title):
+        logger.debug("Error detected in title for %s: '%s'", url, title)
         return True
 
-    # Check for specific error messages in the body
-    error_messages = [
-        "An error occurred on the server",
-        "We apologize for the problem", 
-        "The page you are looking for doesn't exist",
-        "This page cannot be found",
-        "You don't have permission to access",
-        "Service is temporarily unavailable"
-    ]
-    
-    body_text = soup.get_text()
-    message_has_error = any(error_message in body_text for error_message in error_messages)
-    if message_has_error:
-        print(f"DEBUG: Error message detected in body for {url}")
-        return True
+    # Check for specific error messages in the body, only needed when the title looks fine
+    # and the raw bytes contain a word of one of the messages
+    body_text = None
+    if ERROR_MESSAGE_HINT_RE.search(content):
+        body_text = ''.join(PAGE_TEXT_XPATH(root))
+        if ERROR_MESSAGE_RE.search(body_text):
+            logger.debug("Error message detected in body for %s", url)
+            return True
 
     # Check if content is suspiciously short (might indicate an error page)
-    if content_length < 500:
-        print(f"DEBUG: Suspiciously short content for {url}: {content_length} chars")
-        print(f"DEBUG: Title: '{title}'")
-        print(f"DEBUG: First 200 chars of body: '{body_text[:200]}'")
+    if len(content) < 500 and logger.isEnabledFor(logging.DEBUG):
+        if body_text is None:
+            body_text = ''.join(PAGE_TEXT_XPATH(root))
+        logger.debug("Suspiciously short content for %s: %d chars", url, len(content))
+        logger.debug("Title: '%s'", title)
+        logger.debug("First 200 chars of body: '%s'", body_text[:200])
         # Don't automatically reject short content, just log it
         
     return False
 
-def save_html(url, content):
+async def save_html(url, content, root):
     """
     Save the HTML content of a URL to a file, unless it's an error page.
     Enhanced with better debugging.
 
     Args:
         url (str): The URL of the page.
-        content (str): The HTML content to save.
+        content (bytes): The HTML content to save, encoded as UTF-8.
+        root (lxml.etree._Element): The root element of the parsed content.
 
     Returns:
         bool: True if the page was saved, False if it was an error page.
     """
     try:
-        soup = BeautifulSoup(content, 'html.parser')
-
         # Check if the page is an error page with enhanced debugging
-        if is_error_page(soup, url, len(content)):
-            print(f"Detected error page at {url}. Skipping save.")
-            failed_pages.append(url)
+        if is_error_page(root, url, content):
+            logger.warning("Detected error page at %s. Skipping save.", url)
+            failed_pages.add(url)
             return False
 
         html_name = get_html_file_name(url)
         if html_name:
             html_path = os.path.join(cfg.HTML_DIR, html_name)
 
-            with open(html_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            saved_html_set.add(url)
-            print(f"DEBUG: Successfully saved HTML for {url} ({len(content)} chars)")
+            await html_write_queue.put((url, html_path, content))
+            logger.debug("Successfully saved HTML for %s (%d bytes)", url, len(content))
         return True
     except Exception as e:
-        print(f"Failed to save HTML for {url}: {e}")
-        failed_pages.append(url)
+        logger.error("Failed to save HTML for %s: %s", url, e)
+        failed_pages.add(url)
         return False
 
-def extract_data_from_content(url, content):
+def encode_as_utf8(content, charset):
+    """
+    Re-encode page bytes as UTF-8, the encoding saved pages are read back in.
+
+    Args:
+        content (bytes): The HTML content, as received.
+        charset (str or None): The charset the server declared for the content.
+
+    Returns:
+        bytes: The content encoded as UTF-8.
+    """
+    if not charset or codecs.lookup(charset).name == 'utf-8':
+        return content
+    return content.decode(charset, errors='replace').encode('utf-8')
+
+def parse_html(content, encoding='utf-8'):
     """
-    Extract data from HTML content.
+    Parse HTML bytes into an lxml element tree.
+
+    Args:
+        content (bytes): The HTML content.
+        encoding (str): The character encoding of the content.
+
+    Returns:
+        lxml.etree._Element: The root element of the document.
+    """
+    parser = etree.HTMLParser(encoding=encoding)
+    parser.feed(content)
+    return parser.close()
+
+def extract_data_from_content(url, root):
+    """
+    Extract data from parsed HTML content. Only pages that passed the error
+    page check in save_html get here, so that check is not repeated.
 
     Args:
         url (str): The URL of the page.
-        content (str): The HTML content.
+        root (lxml.etree._Element): The root element of the parsed page.
 
     Returns:
         tuple: The URL and a dictionary with domains, reference URLs, and image URLs.
     """
     try:
-        page_soup = BeautifulSoup(content, 'html.parser')
-
-        # Check if the page is an error page
-        if is_error_page(page_soup, url, len(content)):
-            print(f"Detected error page at {url}. Skipping processing.")
-            failed_pages.append(url)
-            return url, None
-
-        # Extract reference URLs and count them (preserve URLs as they appear)
-        ref_urls = []
-        for a in page_soup.find_all('a', href=True):
-            href = a['href']
-            if href.startswith(('http://', 'https://')):
-                full_url = urljoin(url, href)
-                ref_urls.append(full_url)
-        
-        ref_url_counts = Counter(ref_urls)
-        domain_counts = Counter(urlparse(ref_url).netloc for ref_url in ref_urls)
+        # Count reference URLs (preserve URLs as they appear) and their domains in one pass
+        ref_url_counts = defaultdict(int)
+        domain_counts = defaultdict(int)
+        for href in LINK_HREF_XPATH(root):
+            # Only absolute http(s) links are returned, so no urljoin is needed
+            try:
+                netloc = get_netloc(href)
+            except ValueError as e:
+                # A malformed link (e.g. an unclosed IPv6 bracket) only loses that link
+                logger.debug("Skipping invalid link %s on %s: %s", href, url, e)
+                continue
+            ref_url_counts[href] += 1
+            domain_counts[netloc] += 1
 
         # Extract images (collect image URLs, don't download yet)
-        images = [urljoin(url, img['src']) for img in page_soup.find_all('img', src=True)]
+        images = []
+        for src in IMAGE_SRC_XPATH(root):
+            try:
+                images.append(urljoin(url, src))
+            except ValueError as e:
+                logger.debug("Skipping invalid image %s on %s: %s", src, url, e)
 
         return url, {
             'domains': dict(domain_counts),  # Domains with counts
@@ -232,10 +546,31 @@ def extract_data_from_content(url, content):
             'images': images  # Just collect image URLs for now
         }
     except Exception as e:
-        print(f"Failed to extract data from {url}: {e}")
-        failed_pages.append(url)
+        logger.error("Failed to extract data from %s: %s", url, e)
+        failed_pages.add(url)
+        return url, None
+
+async def process_page(url, content, root):
+    """
+    Check, save and extract a fetched page in one step, so the error page
+    check, the save and the extraction all share the single parsed tree.
+
+    Args:
+        url (str): The URL of the page, used for the file name.
+        content (bytes): The HTML content, encoded as UTF-8.
+        root (lxml.etree._Element): The root element of the parsed content.
+
+    Returns:
+        tuple: The URL and a dictionary with domains, reference URLs, and image URLs,
+            or None if it's an error page.
+    """
+    # Save HTML content only if it's not an error page
+    if not await save_html(url, content, root):
+        logger.debug("Skipping %s due to error page detection", url)
         return url, None
 
+    return extract_data_from_content(url, root)
+
 async def fetch_and_process_url(session, url):
     """
     Fetch and process a single URL to extract references and images.
@@ -250,46 +585,66 @@ async def fetch_and_process_url(session, url):
     """
     urls_to_try = [url, get_url_alternative(url)]
     last_exception = None
+    transient_error = False
     
-    print(f"DEBUG: Processing {url}")
-    print(f"DEBUG: Will try URLs: {urls_to_try}")
+    logger.debug("Processing %s", url)
+    logger.debug("Will try URLs: %s", urls_to_try)
     
-    for attempt_url in urls_to_try:
-        try:
-            print(f"DEBUG: Attempting to fetch {attempt_url}")
-            async with session.get(attempt_url) as response:
-                print(f"DEBUG: Got response {response.status} for {attempt_url}")
-                print(f"DEBUG: Response headers: {dict(response.headers)}")
+    async with request_semaphore:
+        for attempt_url in urls_to_try:
+            try:
+                logger.debug("Attempting to fetch %s", attempt_url)
+                async with session.get(attempt_url) as response:
+                    logger.debug("Got response %s for %s", response.status, attempt_url)
+                    logger.debug("Response headers: %s", response.headers)
                 
-                response.raise_for_status()
-                page_content = await response.text()
+                    response.raise_for_status()
+
+                    # Decide from the headers alone whether the body is worth reading. The page
+                    # still counts as failed, so it ends up in failed_html.txt for a look
+                    if 'Content-Type' in response.headers and response.content_type not in HTML_CONTENT_TYPES:
+                        logger.warning("Skipping %s: not an HTML page (%s)", attempt_url, response.content_type)
+                        failed_pages.add(url)
+                        return url, None
+
+                    # Parse the body while it streams in, keeping the raw bytes to save
+                    parser = etree.HTMLParser(encoding=response.charset or 'utf-8')
+                    chunks = []
+                    async for chunk in response.content.iter_chunked(64 * 1024):
+                        parser.feed(chunk)
+                        chunks.append(chunk)
+                    page_content = b''.join(chunks)
                 
-                print(f"DEBUG: Got {len(page_content)} chars of content from {attempt_url}")
+                    logger.debug("Got %d bytes of content from %s", len(page_content), attempt_url)
                 
-                # Check if content is meaningful (not just empty or minimal)
-                if len(page_content.strip()) < 100:
-                    print(f"Got minimal content from {attempt_url}, trying alternative...")
-                    continue
-
-                # Save HTML content only if it's not an error page
-                # Use original URL for consistent file naming
-                if not save_html(url, page_content):
-                    # If it's an error page, skip processing
-                    print(f"DEBUG: Skipping {url} due to error page detection")
-                    return url, None
-
-                # Extract data from content
-                print(f"Successfully fetched {attempt_url}")
-                return extract_data_from_content(url, page_content)
+                    # Check if content is meaningful (not just empty or minimal)
+                    if len(page_content.strip()) < 100:
+                        logger.info("Got minimal content from %s, trying alternative...", attempt_url)
+                        continue
+
+                    logger.debug("Successfully fetched %s", attempt_url)
+                    root = parser.close()
+                    # Saved pages are always UTF-8, whatever the server sent
+                    page_content = encode_as_utf8(page_content, response.charset)
+                    return await process_page(url, page_content, root)
                 
-        except Exception as e:
-            print(f"Failed to fetch {attempt_url}: {type(e).__name__}: {e}")
-            last_exception = e
-            continue
+            except Exception as e:
+                logger.info("Failed to fetch %s: %s: %s", attempt_url, type(e).__name__, e)
+                last_exception = e
+
+                # Remember when the server asked us to come back, for the retry
+                if isinstance(e, aiohttp.ClientResponseError) and e.status in (429, 503) and e.headers:
+                    delay = parse_retry_after(e.headers.get('Retry-After'))
+                    if delay is not None:
+                        retry_after[url] = delay
+                transient_error = transient_error or is_transient_error(e)
+                continue
     
     # If we get here, both attempts failed
-    print(f"Failed to process {url} with both trailing slash variants. Last error: {last_exception}")
-    failed_pages.append(url)
+    logger.warning("Failed to process %s with both trailing slash variants. Last error: %s", url, last_exception)
+    failed_pages.add(url)
+    if transient_error:
+        retryable_pages.add(url)
     return url, None
 
 async def process_existing_html(url):
@@ -306,119 +661,262 @@ async def process_existing_html(url):
         html_name = get_html_file_name(url)
         if html_name:
             html_path = os.path.join(cfg.HTML_DIR, html_name)
-            with open(html_path, 'r', encoding='utf-8') as f:
-                page_content = f.read()
+            page_content = await asyncio.to_thread(read_file, html_path)
 
             # Extract data from content
-            return extract_data_from_content(url, page_content)
+            return extract_data_from_content(url, parse_html(page_content))
         else:
-            print(f"No HTML file name for {url}")
-            failed_pages.append(url)
+            logger.warning("No HTML file name for %s", url)
+            failed_pages.add(url)
             return url, None
     except Exception as e:
-        print(f"Failed to process existing HTML for {url}: {e}")
-        failed_pages.append(url)
+        logger.error("Failed to process existing HTML for %s: %s", url, e)
+        failed_pages.add(url)
         return url, None
 
-async def process_images(image_urls):
+async def process_images(session, image_queue):
     """
-    Download and save images from the list of image URLs.
+    Download and save images taken from the image queue, until a None
+    sentinel is received. Runs as one of the image worker tasks.
 
     Args:
-        image_urls (list): A list of image URLs to download.
+        session (aiohttp.ClientSession): The HTTP session to use for downloading.
+        image_queue (asyncio.Queue): Queue of image URLs to download.
 
     Returns:
         list: A list of successfully saved image names.
     """
-    # Create session with proper headers for image downloads too
-    timeout = aiohttp.ClientTimeout(total=30, connect=10)
-    connector = aiohttp.TCPConnector(ssl=False, limit=10)
-    headers = {
-        'User-Agent': 'SubsidiemaatjeBot',
-        'Accept': 'image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.9,nl;q=0.8',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'DNT': '1',
-        'Connection': 'keep-alive',
-        'Sec-Fetch-Dest': 'image',
-        'Sec-Fetch-Mode': 'no-cors',
-        'Sec-Fetch-Site': 'same-origin',
-    }
-    
-    async with aiohttp.ClientSession(timeout=timeout, connector=connector, headers=headers) as session:
-        saved_images = await asyncio.gather(*[save_image(session, img_url) for img_url in image_urls])
-    return [img for img in saved_images if img]  # Remove failed downloads
+    saved_images = []
+    while (img_url := await image_queue.get()) is not None:
+        # Keep the worker alive whatever goes wrong with one image, so the
+        # queue is always drained and one failure doesn't stop other downloads
+        try:
+            image_name = await save_image(session, img_url)
+        except Exception as e:
+            logger.warning("Failed to download image %s: %s", img_url, e)
+            failed_images.append(img_url)
+            continue
+        if image_name:
+            saved_images.append(image_name)
+    return saved_images
 
-def convert_json_to_excel(json_file, excel_file):
+async def queue_images(image_queue, image_urls):
     """
-    Convert JSON data to an Excel file.
+    Put image URLs on the image queue, skipping images that are already queued
+    or saved. Images such as logos and icons appear on nearly every page, so
+    this way each is downloaded only once.
 
     Args:
-        json_file (str): The file path of the JSON file.
-        excel_file (str): The file path to save the Excel file.
+        image_queue (asyncio.Queue): Queue of image URLs to download.
+        image_urls (list): Image URLs found on a page.
 
     Returns:
         None
     """
-    with open(json_file, 'r') as f:
-        data = json.load(f)
+    for img_url in image_urls:
+        img_url = urldefrag(img_url).url
+        if img_url not in queued_images_set and img_url not in saved_images_set:
+            queued_images_set.add(img_url)
+            await image_queue.put(img_url)
 
-    rows = []
-    for url, details in data.items():
-        domain_ref_urls = defaultdict(list)
-        for ref_url, count in details['reference_urls'].items():
-            domain = urlparse(ref_url).netloc
-            domain_ref_urls[domain].append((ref_url, count))
+async def process_urls(session, urls, image_queue, desc, max_retries=MAX_PAGE_RETRIES):
+    """
+    Fetch and process URLs using a fixed pool of worker tasks fed from a
+    queue of (url, attempt, retry_at) items, so only the work in flight runs
+    as tasks. A page that fails goes back on the same queue with its attempt
+    count and the time it may be retried, until it succeeds or runs out of
+    retries. Only failures that may pass on a retry are requeued. Image URLs
+    found on each page are put on the image queue right away, so images
+    download while the remaining pages are still being fetched.
 
-        for domain, urls_counts in domain_ref_urls.items():
-            for ref_url, count in sorted(urls_counts):
-                rows.append({
-                    'Page URL': url,
-                    'Domain': domain,
-                    'Reference URL': ref_url,
-                    'Domain Count': details['domains'][domain],
-                    'URL Count': count
-                })
+    Args:
+        session (aiohttp.ClientSession): The HTTP session to use for fetching.
+        urls (list): The URLs to fetch and process.
+        image_queue (asyncio.Queue): Queue to put found image URLs on.
+        desc (str): Description for the progress bar.
+        max_retries (int): The maximum number of retries per page.
+
+    Returns:
+        None
+    """
+    loop = asyncio.get_running_loop()
+    # Not bounded: workers put retries back on it, and must never block doing so
+    url_queue = asyncio.Queue()
+    progress = tqdm(total=len(urls), desc=desc)
+
+    async def worker():
+        while (item := await url_queue.get()) is not None:
+            url, attempt, retry_at = item
+            try:
+                # Retries are queued behind the other pages, so usually the backoff has passed by now
+                delay = retry_at - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                url, result = await fetch_and_process_url(session, url)
+                if result:
+                    write_page_data(url, result)
+                    await queue_images(image_queue, result['images'])
+                elif url in retryable_pages and attempt < max_retries:
+                    # Only transient failures get another attempt; the rest would fail the same way
+                    logger.info("Retrying %s (Attempt %d/%d)...", url, attempt + 1, max_retries)
+                    retryable_pages.discard(url)
+                    failed_pages.discard(url)
+                    url_queue.put_nowait((url, attempt + 1, loop.time() + get_retry_delay(url, attempt)))
+                    continue
+            except Exception:
+                # Keep the worker alive, or the queue is left without enough consumers and join() never returns
+                logger.exception("Failed to process %s", url)
+                failed_pages.add(url)
+            finally:
+                url_queue.task_done()
+            progress.update()
+
+    workers = [asyncio.create_task(worker()) for _ in range(NUM_PAGE_WORKERS)]
+    for url in urls:
+        url_queue.put_nowait((url, 0, 0))
+    # Wait until every page and every retry is done, then stop the workers
+    await url_queue.join()
+    for _ in workers:
+        url_queue.put_nowait(None)
+    await asyncio.gather(*workers)
+    progress.close()
+
+def write_page_data(url, result):
+    """
+    Append the data of one page to the overview as a JSON line, so results are
+    on disk as soon as a page is done instead of collected in memory until the end.
+    Uses the much faster orjson encoder when it is installed.
 
-    df = pd.DataFrame(rows)
-    df.to_excel(excel_file, index=False)
-    print(f"Data saved to {excel_file}")
+    Args:
+        url (str): The URL of the page.
+        result (dict): The data extracted from the page.
 
-async def retry_failed_pages(session, max_retries=5):
+    Returns:
+        None
     """
-    Retry fetching and processing failed pages up to a maximum number of retries.
+    if orjson is not None:
+        overview_file.write(orjson.dumps({url: result}) + b'\n')
+    else:
+        overview_file.write(json.dumps({url: result}).encode('utf-8') + b'\n')
+
+def read_overview(jsonl_file):
+    """
+    Read the page data back from a JSON Lines overview, one page at a time.
 
     Args:
-        session (aiohttp.ClientSession): The HTTP session to use for fetching.
-        max_retries (int): The maximum number of retry attempts.
+        jsonl_file (str): The file path of the JSON Lines file.
+
+    Yields:
+        tuple: The page URL and its data.
+    """
+    loads = orjson.loads if orjson is not None else json.loads
+    with open(jsonl_file, 'rb') as f:
+        for line in f:
+            yield from loads(line).items()
+
+def convert_jsonl_to_excel(jsonl_file, excel_file):
+    """
+    Convert a saved JSON Lines overview to an Excel file.
+
+    Args:
+        jsonl_file (str): The file path of the JSON Lines file.
+        excel_file (str): The file path to save the Excel file.
 
     Returns:
         None
     """
-    global failed_pages
+    convert_scraped_data_to_excel(read_overview(jsonl_file), excel_file)
 
-    for attempt in range(max_retries):
-        if not failed_pages:
-            break  # Stop if there are no failed pages left
+def convert_scraped_data_to_excel(pages, excel_file):
+    """
+    Convert the scraped data to an Excel file.
 
-        print(f"\nRetrying failed pages (Attempt {attempt + 1}/{max_retries})...")
-        retry_failed_pages_list = failed_pages.copy()
-        failed_pages = []
+    Args:
+        pages (iterable): (page URL, data) pairs, as saved to the overview.
+        excel_file (str): The file path to save the Excel file.
 
-        tasks = [fetch_and_process_url(session, url) for url in retry_failed_pages_list]
+    Returns:
+        None
+    """
+    # Stream the rows straight into the sheet. constant_memory flushes each row
+    # to disk once it's written, so the table is never held in memory. URLs are
+    # written as plain text: Excel allows only 65,530 hyperlinks per sheet, and
+    # xlsxwriter drops the rest of a row once that limit is reached
+    workbook = xlsxwriter.Workbook(excel_file, {'constant_memory': True, 'strings_to_urls': False})
+    worksheet = workbook.add_worksheet()
+    worksheet.write_row(0, 0, EXCEL_COLUMNS, workbook.add_format({'bold': True}))
+
+    row = 1
+    for url, details in pages:
+        domain_ref_urls = defaultdict(list)
+        for ref_url, count in details['reference_urls'].items():
+            domain_ref_urls[get_netloc(ref_url)].append((ref_url, count))
 
-        for future in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Retrying failed URLs"):
-            url, result = await future
-            if result:
-                data[url] = result  # Update data with the result
-                all_image_urls.extend(result['images'])  # Collect image URLs
+        for domain, urls_counts in domain_ref_urls.items():
+            domain_count = details['domains'][domain]
+            for ref_url, count in sorted(urls_counts):
+                # Typed writes, so no URL cell is ever turned into a hyperlink or formula
+                worksheet.write_string(row, 0, url)
+                worksheet.write_string(row, 1, domain)
+                worksheet.write_string(row, 2, ref_url)
+                worksheet.write_number(row, 3, domain_count)
+                worksheet.write_number(row, 4, count)
+                row += 1
+
+    workbook.close()
+    logger.info("Data saved to %s", excel_file)
+
+def iter_sitemap_locs(events):
+    """
+    Yield the URL of each <loc> element from lxml parse events, discarding
+    parsed elements as soon as they are read so memory use stays constant.
 
-        if not failed_pages:
-            break  # Stop if all retries succeeded
+    Args:
+        events (iterable): (event, element) pairs for the 'end' of <loc> elements.
 
-def create_session():
+    Yields:
+        str: The URL in the <loc> element.
+    """
+    for _, loc in events:
+        yield loc.text or ''
+        entry = loc.getparent()
+        loc.clear()
+        # Drop the sitemap entries before this one, they have been read
+        if entry is not None:
+            while entry.getprevious() is not None:
+                del entry.getparent()[0]
+
+async def fetch_sitemap_urls(session, sitemap_url):
+    """
+    Fetch a sitemap and collect its URLs, parsing the XML incrementally as
+    the response body comes in instead of loading the whole document first.
+
+    Args:
+        session (aiohttp.ClientSession): The HTTP session to use for fetching.
+        sitemap_url (str): The URL of the sitemap.
+
+    Returns:
+        list: The URLs listed in the sitemap.
+    """
+    parser = etree.XMLPullParser(events=('end',), tag='{*}loc')
+    sitemap_urls = []
+    async with session.get(sitemap_url) as response:
+        response.raise_for_status()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            parser.feed(chunk)
+            sitemap_urls.extend(iter_sitemap_locs(parser.read_events()))
+    parser.close()
+    sitemap_urls.extend(iter_sitemap_locs(parser.read_events()))
+    return sitemap_urls
+
+def create_session(http_cache=False):
     """
     Create an aiohttp session with browser-like headers and proper configuration.
+
+    Args:
+        http_cache (bool): Keep responses in an on-disk cache, so reruns during
+            development don't download every page again. Needs aiohttp-client-cache.
     
     Returns:
         aiohttp.ClientSession: Configured session
@@ -445,18 +943,53 @@ def create_session():
     # SSL configuration (disable SSL verification if needed)
     connector = aiohttp.TCPConnector(
         ssl=False,  # Try with SSL disabled first
-        limit=10,   # Limit concurrent connections
-        force_close=True,
+        limit=100,  # Limit concurrent connections
+        # Nearly every request goes to the one site, so let each semaphore holder get a
+        # connection right away instead of queueing in the pool against the connect timeout
+        limit_per_host=MAX_CONCURRENT_REQUESTS,
+        ttl_dns_cache=300,  # Cache DNS lookups for the duration of a run
+        keepalive_timeout=75,  # Keep idle connections to the site open between requests
         enable_cleanup_closed=True
     )
     
+    if http_cache:
+        if CachedSession is not None:
+            return CachedSession(
+                cache=SQLiteBackend(cfg.HTTP_CACHE_FILE, expire_after=HTTP_CACHE_EXPIRE_AFTER),
+                timeout=timeout,
+                connector=connector,
+                headers=headers
+            )
+        logger.warning("aiohttp-client-cache is not installed, running without the HTTP cache")
+
     return aiohttp.ClientSession(
         timeout=timeout,
         connector=connector,
         headers=headers
     )
 
-async def main(sitemap_url=None, sitemap_file=None, json_index_url=None, additional_urls=[], path_filter=None):
+def start_logging(level):
+    """
+    Set up logging through a queue. Log calls only put the record on the queue,
+    and a listener thread writes it out, so no log call blocks the event loop.
+
+    Args:
+        level (str): The log level, e.g. 'INFO' or 'DEBUG'.
+
+    Returns:
+        logging.handlers.QueueListener: The running listener, to stop when done.
+    """
+    log_queue = queue.SimpleQueue()
+    # The queue handler formats the message, the listener only writes it
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+    logging.basicConfig(level=level, handlers=[queue_handler])
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+    listener.start()
+    return listener
+
+async def main(sitemap_url=None, sitemap_file=None, json_index_url=None, additional_urls=[], path_filter=None,
+               http_cache=False):
     """
     Main function to process the sitemap/index and extract data from each URL.
     Enhanced with better session configuration.
@@ -467,163 +1000,179 @@ async def main(sitemap_url=None, sitemap_file=None, json_index_url=None, additio
         json_index_url (str): The URL of a JSON index (e.g., with ?new_json=true&pager_rows=500).
         additional_urls (list): A list of additional URLs to process.
         path_filter (str): Optional path filter to only scrape URLs containing this path (e.g., '/subsidies').
+        http_cache (bool): Serve repeated requests from the on-disk HTTP cache.
 
     Returns:
         None
     """
-    global data, all_image_urls
-    data = {}
-    all_image_urls = []
-
-    urls = []
-
-    if json_index_url:
-        async with create_session() as session:
+    global overview_file
+
+    # asyncio.to_thread runs on the default executor; a few threads are enough for the disk
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=NUM_DISK_THREADS))
+
+    # Directories to save images and HTML pages
+    os.makedirs(cfg.IMAGE_DIR, exist_ok=True)
+    os.makedirs(cfg.HTML_DIR, exist_ok=True)
+    with os.scandir(cfg.IMAGE_DIR) as entries:
+        existing_images_set.update(entry.name for entry in entries)
+
+    # Each page's data is appended as soon as it's extracted. It goes to a temporary
+    # file first, so the previous run's overview is kept until this run has finished
+    overview_path = os.path.join(cfg.BASE_DIR, 'scraped_data_overview.jsonl')
+    overview_file = open(overview_path + '.tmp', 'wb')
+
+    # One session for the whole run, so connections and DNS lookups are
+    # reused across the index, page, retry and image requests
+    async with create_session(http_cache) as session:
+        # Start the HTML writer and image workers first, so pages are written and
+        # images download while the remaining pages are processed
+        writer = asyncio.create_task(html_writer())
+        image_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        image_workers = [asyncio.create_task(process_images(session, image_queue))
+                         for _ in range(NUM_IMAGE_WORKERS)]
+
+        # Collected in a set, so URLs listed more than once are only kept once
+        urls = set()
+
+        if json_index_url:
             async with session.get(json_index_url) as response:
                 response.raise_for_status()
-                json_content = await response.text()
-
-        # Parse JSON index
-        json_data = json.loads(json_content)
-        json_urls = [item['source_url'] for item in json_data if 'source_url' in item]
-
-        # Apply path filter if specified
-        if path_filter:
-            filtered_urls = [url for url in json_urls if path_filter in urlparse(url).path]
-            urls.extend(filtered_urls)
-            print(f"Found {len(json_urls)} URLs in JSON index, {len(filtered_urls)} matching path filter '{path_filter}'")
-        else:
-            urls.extend(json_urls)
-            print(f"Found {len(json_urls)} URLs in JSON index")
-
-    elif sitemap_file:
-        # Read sitemap from local file
-        with open(sitemap_file, 'r', encoding='utf-8') as f:
-            sitemap_content = f.read()
-
-        # Parse sitemap
-        soup = BeautifulSoup(sitemap_content, 'lxml-xml')
-        sitemap_urls = [loc.text for loc in soup.find_all('loc')]
-
-        # Apply path filter if specified
-        if path_filter:
-            filtered_urls = [url for url in sitemap_urls if path_filter in urlparse(url).path]
-            urls.extend(filtered_urls)
-            print(f"Found {len(sitemap_urls)} URLs in sitemap file, {len(filtered_urls)} matching path filter '{path_filter}'")
-        else:
-            urls.extend(sitemap_urls)
-            print(f"Found {len(sitemap_urls)} URLs in sitemap file")
-
-    elif sitemap_url:
-        async with create_session() as session:
-            async with session.get(sitemap_url) as response:
-                response.raise_for_status()
-                sitemap_content = await response.text()
-
-        # Parse sitemap
-        soup = BeautifulSoup(sitemap_content, 'lxml-xml')
-        sitemap_urls = [loc.text for loc in soup.find_all('loc')]
-
-        # Apply path filter if specified
-        if path_filter:
-            filtered_urls = [url for url in sitemap_urls if path_filter in urlparse(url).path]
-            urls.extend(filtered_urls)
-            print(f"Found {len(sitemap_urls)} URLs in sitemap, {len(filtered_urls)} matching path filter '{path_filter}'")
-        else:
-            urls.extend(sitemap_urls)
-            print(f"Found {len(sitemap_urls)} URLs in sitemap")
-
-    # Add additional URLs
-    urls.extend(additional_urls)
-
-    # Read failed URLs from failed_html.txt and add them to the list
-    failed_html_path = cfg.FAILED_HTML_FILE
-    if os.path.exists(failed_html_path):
-        with open(failed_html_path, 'r') as f:
-            failed_urls = [line.strip() for line in f if line.strip()]
-            urls.extend(failed_urls)
-            print(f"Added {len(failed_urls)} URLs from {failed_html_path}")
-
-    # Remove duplicates
-    urls = list(set(urls))
-    print(f"Total unique URLs to process: {len(urls)}")
-
-    # Load existing HTML file names
-    existing_html_files = set(os.listdir(cfg.HTML_DIR))
-
-    # Prepare lists for URLs to scrape and URLs to process from existing HTML
-    urls_to_scrape = []
-    urls_to_process = []
-
-    for url in urls:
-        html_name = get_html_file_name(url)
-        if html_name and html_name in existing_html_files:
-            print(f"HTML exists for {url}, will process existing file.")
-            urls_to_process.append(url)
+                json_content = await response.read()
+
+            # Parse JSON index straight from the raw bytes, json detects the UTF encoding itself
+            json_data = json.loads(json_content)
+            json_urls = [item['source_url'] for item in json_data if 'source_url' in item]
+
+            # Apply path filter if specified
+            if path_filter:
+                filtered_urls = [url for url in json_urls if path_filter in urlparse(url).path]
+                urls.update(filtered_urls)
+                logger.info("Found %d URLs in JSON index, %d matching path filter '%s'",
+                            len(json_urls), len(filtered_urls), path_filter)
+            else:
+                urls.update(json_urls)
+                logger.info("Found %d URLs in JSON index", len(json_urls))
+
+        elif sitemap_file:
+            # Stream-parse sitemap from local file
+            events = etree.iterparse(sitemap_file, events=('end',), tag='{*}loc')
+            sitemap_urls = list(iter_sitemap_locs(events))
+
+            # Apply path filter if specified
+            if path_filter:
+                filtered_urls = [url for url in sitemap_urls if path_filter in urlparse(url).path]
+                urls.update(filtered_urls)
+                logger.info("Found %d URLs in sitemap file, %d matching path filter '%s'",
+                            len(sitemap_urls), len(filtered_urls), path_filter)
+            else:
+                urls.update(sitemap_urls)
+                logger.info("Found %d URLs in sitemap file", len(sitemap_urls))
+
+        elif sitemap_url:
+            sitemap_urls = await fetch_sitemap_urls(session, sitemap_url)
+
+            # Apply path filter if specified
+            if path_filter:
+                filtered_urls = [url for url in sitemap_urls if path_filter in urlparse(url).path]
+                urls.update(filtered_urls)
+                logger.info("Found %d URLs in sitemap, %d matching path filter '%s'",
+                            len(sitemap_urls), len(filtered_urls), path_filter)
+            else:
+                urls.update(sitemap_urls)
+                logger.info("Found %d URLs in sitemap", len(sitemap_urls))
+
+        # Add additional URLs
+        urls.update(additional_urls)
+
+        # Read failed URLs from failed_html.txt and add them to the list
+        failed_html_path = cfg.FAILED_HTML_FILE
+        if os.path.exists(failed_html_path):
+            with open(failed_html_path, 'r') as f:
+                failed_urls = [line.strip() for line in f if line.strip()]
+                urls.update(failed_urls)
+                logger.info("Added %d URLs from %s", len(failed_urls), failed_html_path)
+
+        logger.info("Total unique URLs to process: %d", len(urls))
+
+        # Load existing HTML file names. scandir reads the names straight from the
+        # directory entries without building an intermediate list, and only the
+        # names of the URLs in this run are kept, however many files the directory holds
+        expected_html_files = {get_html_file_name(url) for url in urls}
+        with os.scandir(cfg.HTML_DIR) as entries:
+            existing_html_files = {entry.name for entry in entries if entry.name in expected_html_files}
+
+        # Prepare lists for URLs to scrape and URLs to process from existing HTML
+        urls_to_scrape = []
+        urls_to_process = []
+
+        for url in urls:
+            html_name = get_html_file_name(url)
+            if html_name and html_name in existing_html_files:
+                logger.debug("HTML exists for %s, will process existing file.", url)
+                urls_to_process.append(url)
+            else:
+                urls_to_scrape.append(url)
+
+        # Process URLs with existing HTML files. Reading and parsing a local file
+        # doesn't wait on anything, so the files are handled one at a time
+        # instead of creating a task for every file up front
+        logger.info("Processing %d URLs from existing HTML files...", len(urls_to_process))
+        for url in tqdm(urls_to_process, desc="Processing existing HTML"):
+            url, result = await process_existing_html(url)
+            if result:
+                write_page_data(url, result)
+                await queue_images(image_queue, result['images'])
+            elif url in failed_pages:
+                # Fetch the page again from the site if its saved file can't be used
+                failed_pages.discard(url)
+                urls_to_scrape.append(url)
+
+        # Scrape and process new URLs, retrying failed pages with backoff
+        if urls_to_scrape:
+            logger.info("Scraping and processing %d new URLs...", len(urls_to_scrape))
+            await process_urls(session, urls_to_scrape, image_queue, desc="Processing new URLs")
         else:
-            urls_to_scrape.append(url)
-
-    # Process URLs with existing HTML files
-    print(f"Processing {len(urls_to_process)} URLs from existing HTML files...")
-    existing_tasks = [process_existing_html(url) for url in urls_to_process]
-    for future in tqdm(asyncio.as_completed(existing_tasks), total=len(existing_tasks), desc="Processing existing HTML"):
-        url, result = await future
-        if result:
-            data[url] = result
-            all_image_urls.extend(result['images'])  # Collect image URLs
-
-    # Scrape and process new URLs
-    if urls_to_scrape:
-        print(f"Scraping and processing {len(urls_to_scrape)} new URLs...")
-        async with create_session() as session:
-            tasks = [fetch_and_process_url(session, url) for url in urls_to_scrape]
-
-            for future in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Processing new URLs"):
-                url, result = await future
-                if result:
-                    data[url] = result
-                    all_image_urls.extend(result['images'])  # Collect image URLs
+            logger.info("No new URLs to scrape.")
 
-            # Retry failed pages
-            await retry_failed_pages(session, max_retries=10)
-    else:
-        print("No new URLs to scrape.")
+        # All pages are done; let the writer and image workers finish their queues
+        await html_write_queue.put(None)
+        await writer
 
-    # Process images separately
-    print("Processing images...")
-    saved_images = await process_images(all_image_urls)
-    print(f"Total images processed: {len(saved_images)}")
+        logger.info("Processing images...")
+        for _ in image_workers:
+            await image_queue.put(None)
+        saved_images = [name for names in await asyncio.gather(*image_workers) for name in names]
+        logger.info("Total images processed: %d", len(saved_images))
 
-    # Save results to JSON
-    with open(os.path.join(cfg.BASE_DIR, 'scraped_data_overview.json'), 'w') as f:
-        json.dump(data, f, indent=4)
+    overview_file.close()
+    os.replace(overview_path + '.tmp', overview_path)
+    logger.info("Data saved to %s", overview_path)
 
-    print("Scraping completed.")
+    logger.info("Scraping completed.")
 
-    # Convert JSON data to Excel
-    convert_json_to_excel(os.path.join(cfg.BASE_DIR, 'scraped_data_overview.json'),
-                          os.path.join(cfg.BASE_DIR, 'scraped_data_overview.xlsx'))
+    # Convert the overview to Excel, reading it back one page at a time
+    convert_jsonl_to_excel(overview_path, os.path.join(cfg.BASE_DIR, 'scraped_data_overview.xlsx'))
 
     # Write any remaining failed pages and images to files (overwrite failed_html.txt)
     if failed_pages:
         with open(cfg.FAILED_HTML_FILE, 'w') as f:
-            for page in failed_pages:
+            for page in sorted(failed_pages):
                 f.write(f"{page}\n")
-        print(f"Failed pages saved to {cfg.FAILED_HTML_FILE}")
+        logger.info("Failed pages saved to %s", cfg.FAILED_HTML_FILE)
     else:
         # If no failed pages, ensure failed_html.txt is empty
         open(cfg.FAILED_HTML_FILE, 'w').close()
-        print(f"No failed pages. {cfg.FAILED_HTML_FILE} has been cleared.")
+        logger.info("No failed pages. %s has been cleared.", cfg.FAILED_HTML_FILE)
 
     if failed_images:
         with open(cfg.FAILED_IMAGES_FILE, 'w') as f:
             for img in failed_images:
                 f.write(f"{img}\n")
-        print(f"Failed images saved to {cfg.FAILED_IMAGES_FILE}")
+        logger.info("Failed images saved to %s", cfg.FAILED_IMAGES_FILE)
     else:
         # If no failed images, ensure failed_images.txt is empty
         open(cfg.FAILED_IMAGES_FILE, 'w').close()
-        print(f"No failed images. {cfg.FAILED_IMAGES_FILE} has been cleared.")
+        logger.info("No failed images. %s has been cleared.", cfg.FAILED_IMAGES_FILE)
 
 if __name__ == '__main__':
     # Parse command-line arguments
@@ -636,8 +1185,18 @@ if __name__ == '__main__':
                         help='Path to a local sitemap file')
     parser.add_argument('--json_index_url', type=str, default=None,
                         help='URL of a JSON index page (e.g., https://www.amsterdam.nl/subsidies/subsidies-alfabet?new_json=true&pager_rows=500)')
+    parser.add_argument('--log_level', type=str, default=cfg.LOG_LEVEL,
+                        help=f'Log level, e.g. DEBUG for per-page details (default: {cfg.LOG_LEVEL})')
+    parser.add_argument('--http_cache', action='store_true',
+                        help='Cache responses on disk for a day, for development reruns (needs aiohttp-client-cache)')
     args = parser.parse_args()
 
+    listener = start_logging(args.log_level.upper())
+
+    # Run on the faster libuv based event loop when uvloop is installed
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
     # Default to sitemap if none is specified
     if not args.sitemap_url and not args.sitemap_file and not args.json_index_url:
         args.sitemap_url = 'https://www.amsterdam.nl/sitemap.xml'
@@ -647,6 +1206,10 @@ if __name__ == '__main__':
         # Add more URLs as needed
     ]
 
-    asyncio.run(main(sitemap_url=args.sitemap_url, sitemap_file=args.sitemap_file,
-                     json_index_url=args.json_index_url,
-                     additional_urls=additional_urls, path_filter=args.path_filter))
\ No newline at end of file
+    try:
+        asyncio.run(main(sitemap_url=args.sitemap_url, sitemap_file=args.sitemap_file,
+                         json_index_url=args.json_index_url,
+                         additional_urls=additional_urls, path_filter=args.path_filter,
+                         http_cache=args.http_cache))
+    finally:
+        listener.stop()
\ No newline at end of file